@@ -0,0 +1,208 @@
+import asyncio
+import os
+import re
+
+os.environ.setdefault("OPENAI_API_KEY", "test")  # The OpenAI client is created at import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import app
+
+# Each TestClient runs its own event loop, which async-lru notices and handles by resetting its cache
+pytestmark = pytest.mark.filterwarnings("ignore::async_lru.AlruCacheLoopResetWarning")
+
+PARAGRAPH = "Un café – naïve résumé. " * 6
+
+
+def test_extract_paragraphs_uses_header_charset():
+    html = f"<!doctype html><html><body><p>{PARAGRAPH}</p></body></html>".encode("utf-8")
+    assert app.extract_paragraphs(html, "utf-8") == (PARAGRAPH.strip(),)
+
+
+def test_extract_paragraphs_detects_utf8_without_any_charset():
+    html = f"<!doctype html><html><body><p>{PARAGRAPH}</p></body></html>".encode("utf-8")
+    assert app.extract_paragraphs(html) == (PARAGRAPH.strip(),)
+
+
+def test_extract_paragraphs_honours_meta_charset():
+    html = f'<html><head><meta charset="iso-8859-1"></head><body><p>{PARAGRAPH}</p></body></html>'
+    assert app.extract_paragraphs(html.replace("–", "-").encode("iso-8859-1")) == (PARAGRAPH.replace("–", "-").strip(),)
+
+
+@pytest.fixture
+def serve_page(monkeypatch):
+    """
+    Return a factory for a TestClient whose shared HTTP client answers every request with one page.
+    The mock transport is injected before startup, so the lifespan creates and closes that client.
+    """
+    def make_client(body: bytes, content_type: str):
+        def handler(request):
+            return httpx.Response(200, content=body, headers={"content-type": content_type})
+
+        transport = httpx.MockTransport(handler)
+        monkeypatch.setattr(app, "AsyncClient", lambda **kwargs: httpx.AsyncClient(transport=transport, **kwargs))
+        app.scrape_paragraphs.cache_clear()  # Each test serves its own page
+        return TestClient(app.app)
+
+    return make_client
+
+
+def test_scrape_decodes_charset_declared_only_in_header(serve_page):
+    body = f"<!doctype html><html><body><p>{PARAGRAPH}</p></body></html>".encode("utf-8")
+    with serve_page(body, "text/html; charset=utf-8") as client:
+        response = client.get("/scrape", params={"url": "https://example.com/header-charset"})
+
+    assert response.status_code == 200
+    assert response.json()["content"] == PARAGRAPH.strip()
+
+
+@pytest.mark.parametrize("charset", ["utf8mb4", "x-user-defined", "bogus-enc", "euc_kr"])
+def test_scrape_falls_back_when_header_charset_is_unsupported(serve_page, charset):
+    body = f"<!doctype html><html><body><p>{PARAGRAPH}</p></body></html>".encode("utf-8")
+    with serve_page(body, f"text/html; charset={charset}") as client:
+        response = client.get("/scrape", params={"url": f"https://example.com/{charset}"})
+
+    assert response.status_code == 200
+    assert response.json()["content"] == PARAGRAPH.strip()
+
+
+def test_extract_paragraphs_accepts_python_codec_aliases():
+    html = f"<html><body><p>{PARAGRAPH.replace('–', '-')}</p></body></html>".encode("iso-8859-1")
+    assert app.extract_paragraphs(html, "latin_1") == (PARAGRAPH.replace("–", "-").strip(),)
+
+
+def test_pack_paragraphs_keeps_paragraphs_whole_when_they_fit():
+    paragraphs = ["a" * 1000, "b" * 1000, "c" * 1000, "d" * 500]
+    assert app.pack_paragraphs(paragraphs, 3000) == [["a" * 1000, "b" * 1000], ["c" * 1000, "d" * 500]]
+
+
+def test_pack_paragraphs_splits_paragraphs_longer_than_a_chunk():
+    paragraphs = ["x" * 200000, "y" * 200000, "z" * 200]
+    chunks = app.pack_paragraphs(paragraphs, 3000)
+
+    assert all(len("\n".join(chunk)) <= 3000 for chunk in chunks)
+    assert "".join(piece for chunk in chunks for piece in chunk) == "".join(paragraphs)
+
+
+def test_truncate_paragraphs_caps_total_characters():
+    assert app.truncate_paragraphs(["a" * 40, "b" * 40, "c" * 40], 100) == ("a" * 40, "b" * 40, "c" * 20)
+    assert app.truncate_paragraphs(["a" * 40, "b" * 40], 100) == ("a" * 40, "b" * 40)
+
+
+def make_page(page, count, size):
+    """
+    Paragraphs of the given size, each starting with a unique marker like "[p1-03]".
+    """
+    return tuple(f"[p{page}-{i:02d}]".ljust(size, "x") for i in range(count))
+
+
+def markers(text):
+    return re.findall(r"\[p\d-\d\d\]", text)
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """
+    Stub search, scraping and summarization, then run /search_scrape_summarize over the given pages.
+    Pages finish scraping in list order; a page may be an exception to raise instead.
+    Returns the endpoint's result and the recorded summarize calls as (content, pages scraped so far).
+    """
+    def run(pages):
+        calls = []
+        scraped = []
+
+        async def search_topic(topic, engine):
+            return {"articles": [{"title": str(i), "link": f"https://example.com/{i}"} for i in range(len(pages))]}
+
+        async def scrape_with_limit(url):
+            index = int(url.rsplit("/", 1)[1])
+            await asyncio.sleep(0.01 * index)
+            if isinstance(pages[index], Exception):
+                raise pages[index]
+            scraped.append(index)
+            return pages[index]
+
+        async def summarize_text(content, use_cache=False):
+            calls.append((content, len(scraped)))
+            number = len(calls)
+            await asyncio.sleep(0)
+            return f"summary{number}"
+
+        monkeypatch.setattr(app, "search_topic", search_topic)
+        monkeypatch.setattr(app, "scrape_with_limit", scrape_with_limit)
+        monkeypatch.setattr(app, "summarize_text", summarize_text)
+        return asyncio.run(app.search_scrape_summarize("topic")), calls
+
+    return run
+
+
+def test_pipeline_small_content_makes_one_unlabelled_call(pipeline):
+    pages = [make_page(page, 2, 1000) for page in range(3)]
+    result, calls = pipeline(pages)
+
+    assert result == {"summary": "summary1"}
+    assert len(calls) == 1
+    assert "Chunk" not in calls[0][0]
+    assert sorted(markers(calls[0][0])) == sorted(markers("".join(p for page in pages for p in page)))
+
+
+def test_pipeline_content_fitting_one_batch_makes_one_labelled_call(pipeline, monkeypatch):
+    monkeypatch.setattr(app, "SINGLE_REQUEST_MAX_CHARS", 5000)
+    pages = [make_page(0, 4, 1499)]  # Two paragraphs per chunk, so two chunks
+    result, calls = pipeline(pages)
+
+    assert result == {"summary": "summary1"}
+    assert len(calls) == 1
+    assert re.findall(r"Chunk \d+:", calls[0][0]) == ["Chunk 1:", "Chunk 2:"]
+    assert markers(calls[0][0]) == markers("".join(pages[0]))
+
+
+def test_pipeline_medium_content_batches_then_fuses(pipeline):
+    pages = [make_page(0, 5, 2900)]  # One paragraph per chunk, so five chunks
+    result, calls = pipeline(pages)
+
+    assert result == {"summary": "summary3"}
+    assert len(calls) == 3
+    assert [len(re.findall(r"Chunk \d+:", content)) for content, _ in calls[:2]] == [4, 1]
+    assert markers("".join(content for content, _ in calls[:2])) == markers("".join(pages[0]))
+    assert calls[2][0] == "summary1 summary2"
+
+
+def test_pipeline_large_content_summarizes_batches_while_scraping(pipeline):
+    pages = [make_page(page, 10, 1000) for page in range(3)]  # Two paragraphs per chunk
+    result, calls = pipeline(pages)
+
+    assert result == {"summary": "summary5"}
+    batch_calls, fuse_call = calls[:4], calls[4]
+    assert [len(re.findall(r"Chunk \d+:", content)) for content, _ in batch_calls] == [4, 4, 4, 3]
+    # The first batches start before the last page has been scraped
+    assert [scraped for _, scraped in batch_calls] == [2, 2, 3, 3]
+
+    sent = markers("".join(content for content, _ in batch_calls))
+    assert len(sent) == len(set(sent))
+    assert sorted(sent) == sorted(markers("".join(p for page in pages for p in page)))
+    assert fuse_call[0] == "summary1 summary2 summary3 summary4"
+
+
+def test_pipeline_held_back_chunk_is_filled_by_the_next_page(pipeline):
+    pages = [make_page(0, 16, 1000), make_page(1, 1, 500)]  # Eight chunks, then a short paragraph
+    result, calls = pipeline(pages)
+
+    assert result == {"summary": "summary3"}
+    batch_calls = calls[:2]
+    assert [len(re.findall(r"Chunk \d+:", content)) for content, _ in batch_calls] == [4, 4]
+    # The page 1 paragraph shares the last chunk with the final page 0 paragraphs
+    last_chunk = batch_calls[1][0].split("Chunk 4:")[1]
+    assert markers(last_chunk) == ["[p0-14]", "[p0-15]", "[p1-00]"]
+
+
+def test_pipeline_failing_scrape_returns_500(pipeline):
+    pages = [make_page(0, 20, 1000), HTTPException(status_code=404, detail="HTTP error")]
+    with pytest.raises(HTTPException) as error:
+        pipeline(pages)
+
+    assert error.value.status_code == 500
+    assert "HTTP error" in error.value.detail